@@ -4,9 +4,33 @@ import argparse
 import hashlib
 import os
 import shutil
-import xml.etree.ElementTree as ET
+import sys
 import zipfile
 import difflib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import lxml.etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    process = None
+
+# Faster DEFLATE implementations are drop-in replacements for zlib in zipfile
+try:
+    from isal import isal_zlib
+    zipfile.zlib = isal_zlib
+except ImportError:
+    try:
+        from zlib_ng import zlib_ng
+        zipfile.zlib = zlib_ng
+    except ImportError:
+        pass
 
 CONST_UNKNOWN_REGION = 'Unknown'
 CONST_BAD_ROM = 'Bad'
@@ -27,14 +51,28 @@ LICENSES = {
 
 PRIORITY_REGIONS = ['USA', 'Japan', 'Europe']
 
-def find_db_export_archive(directory):
-    db_archives = list(filter(lambda p : p.endswith(".zip") and "(DB Export)" in p, os.listdir(directory)))
-
+g_crc_to_sha1 = {}
+
+def scan_db_directory(directory):
+    db_archives = []
+    dat_archives = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            name = entry.name
+            if name.endswith(".zip"):
+                if "(DB Export)" in name:
+                    db_archives.append(name)
+                if "(Private)" in name:
+                    dat_archives.append(name)
+    db_archives.sort(reverse = True)
+    dat_archives.sort(reverse = True)
+    return db_archives, dat_archives
+
+def find_db_export_archive(directory, db_archives):
     if len(db_archives) == 0:
         raise FileNotFoundError("DB arhive not found.")
 
     if len(db_archives) > 1:
-        db_archives.sort(reverse = True)
         print(f"WARNING: More than one DB archive found:")
         for db_archive in db_archives:
             print(f"  - {db_archive}")
@@ -42,14 +80,11 @@ def find_db_export_archive(directory):
 
     return os.path.join(directory, db_archives[0])
 
-def find_private_dat_archive(directory):
-    dat_archives = list(filter(lambda p : p.endswith(".zip") and "(Private)" in p, os.listdir(directory)))
-
+def find_private_dat_archive(directory, dat_archives):
     if len(dat_archives) == 0:
         return None
 
     if len(dat_archives) > 1:
-        dat_archives.sort(reverse = True)
         print(f"WARNING: More than one private dat archive found:")
         for dat_archive in dat_archives:
             print(f"  - {dat_archive}")
@@ -57,111 +92,146 @@ def find_private_dat_archive(directory):
 
     return os.path.join(directory, dat_archives[0])
 
+@contextmanager
 def extract_xml_from_archive(archive_path):
     with zipfile.ZipFile(archive_path, 'r') as zip_ref:
         xml_files = [name for name in zip_ref.namelist() if name.endswith('.xml')]
         if len(xml_files) != 1:
             raise FileNotFoundError("The archive does not contain exactly one XML file.")
         with zip_ref.open(xml_files[0]) as xml_file:
-            return xml_file.read()
-
-def parse_xml(xml_content):
-    return ET.fromstring(xml_content)
-
-def build_game_dict(root, args):
+            yield xml_file
+
+def parse_xml(xml_file):
+    for _, elem in ET.iterparse(xml_file, events=('end',)):
+        if elem.tag == 'game':
+            yield elem
+            elem.clear()
+            # lxml keeps already processed siblings attached to the root
+            if hasattr(elem, 'getprevious'):
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+def build_game_dict(games, args):
     game_dict = {}
     sha1_to_game_id = {}
-    for game in root.findall('game'):
-        full_name = game.attrib.get('name')
+    sha1_collisions = {}
+    crc_to_sha1 = {}
+
+    intern = sys.intern
+    licenses = LICENSES
+    unknown_region = CONST_UNKNOWN_REGION
+    bad_rom = CONST_BAD_ROM
+    no_unlicensed = args.no_unlicensed
+    no_bios = args.no_bios
+    no_bad_roms = args.no_bad_roms
+    with_headerless = args.with_headerless
+    verbose = args.verbose
+    name_suffixes = {}
+
+    for game in games:
+        full_name = game.get('name')
         if args.skip_common_prefix:
             if full_name.startswith(args.skip_common_prefix):
                 full_name = full_name[len(args.skip_common_prefix):]
 
-        for archive in game.findall('archive'):
-            game_id = archive.attrib.get('number')
+        archives = []
+        sources = []
+        releases = []
+        for child in game:
+            if child.tag == 'archive':
+                archives.append(child)
+            elif child.tag == 'source':
+                sources.append(child)
+            elif child.tag == 'release':
+                releases.append(child)
+
+        for archive in archives:
+            a = archive.attrib
+            game_id = a.get('number')
             if game_id not in game_dict:
-                game_regions = [r for r in archive.attrib.get('region').split(', ') if r != CONST_UNKNOWN_REGION]
+                game_regions = [intern(r) for r in a.get('region').split(', ') if r != unknown_region]
                 game_regions.sort()
-                game_license =  LICENSES[archive.attrib.get('licensed')]
-                if args.no_unlicensed and game_license != CONST_LICENSED:
+                game_license =  licenses[a.get('licensed')]
+                if no_unlicensed and game_license != CONST_LICENSED:
                     continue
-                bios = archive.attrib.get('bios') == '1'
-                if bios and args.no_bios:
+                bios = a.get('bios') == '1'
+                if bios and no_bios:
                     continue
-                clone = archive.attrib.get('clone')
+                clone = a.get('clone')
                 game_dict[game_id] = {
                     'full_name': full_name,
-                    'name': archive.attrib.get('name'),
+                    'name': a.get('name'),
                     'clone': CONST_PARENT_CLONE if clone == None or str(clone).lower() == 'p' else clone,
                     'clones': [],
-                    'devstatus': archive.attrib.get('devstatus'),
+                    'devstatus': a.get('devstatus'),
                     'bios': bios,
-                    'languages': archive.attrib.get('languages').split(','),
+                    'languages': [intern(l) for l in a.get('languages').split(',')],
                     'license': game_license,
                     'regions': game_regions,
-                    'version1': archive.attrib.get('version1'),
-                    'version2': archive.attrib.get('version2'),
+                    'version1': a.get('version1'),
+                    'version2': a.get('version2'),
                     'files': {}
                 }
-            for source in game.findall('source') + game.findall('release'):
+            for source in sources + releases:
+                details = source.find('details')
+                da = details.attrib if details != None else None
                 for file in source.findall('file'):
-                    format = file.attrib.get('format')
-                    file_size = int(file.attrib.get('size'))
-                    file_item = file.attrib.get('item')
-                    ext = file.attrib.get('extension')
-                    force_file_name = file.attrib.get('forcename')
-                    if force_file_name:
+                    fa = file.attrib
+                    format = fa.get('format')
+                    if format != None:
+                        format = intern(format)
+                    file_size = int(fa.get('size'))
+                    file_item = fa.get('item')
+                    ext = fa.get('extension')
+                    force_file_name = fa.get('forcename')
+                    if force_file_name and verbose:
                         print(f"Force file name: {force_file_name}")
-                    if format == "Headerless" and not args.with_headerless:
+                    if format == "Headerless" and not with_headerless:
                         continue
-                    sha1 = file.attrib.get('sha1')
-                    details = source.find('details')
+                    sha1 = fa.get('sha1')
+                    crc = fa.get('crc32')
                     if details == None:
                         raise Exception("Game details not found")
-                    rominfo = details.attrib.get('rominfo')
-                    if args.no_bad_roms and rominfo == CONST_BAD_ROM:
+                    rominfo = da.get('rominfo')
+                    if rominfo != None:
+                        rominfo = intern(rominfo)
+                    if no_bad_roms and rominfo == bad_rom:
                         continue
-                    regions = details.attrib.get('region').split(', ')
-                    sections = [details.attrib.get('section')]
+                    regions = [intern(r) for r in da.get('region').split(', ')]
+                    sections = [intern(s) for s in [da.get('section')] if s != None]
+                    if force_file_name:
+                        expected_name = force_file_name
+                    else:
+                        suffix_key = (file_item, ext)
+                        suffix = name_suffixes.get(suffix_key)
+                        if suffix == None:
+                            suffix = (f" ({file_item})" if file_item != None else "") + (f".{ext}" if ext != None else "")
+                            name_suffixes[suffix_key] = suffix
+                        expected_name = full_name + suffix
+
                     file_info = {
                         'format': format,
-                        'expected_name': full_name,
+                        'expected_name': expected_name,
                         'file_size': file_size,
-                        'regions': [r for r in regions if r != CONST_UNKNOWN_REGION],
-                        'sections': [s for s in sections if s != None],
+                        'regions': set(r for r in regions if r != unknown_region),
+                        'sections': set(sections),
                         'rominfo': rominfo,
                         'package_path': None,
                         'file_name': None,
                     }
 
-                    if force_file_name:
-                        file_info['expected_name'] = force_file_name
-                    else:
-                        n = full_name
-                        if file_item != None:
-                            n = f"{n} ({file_item})"
-                        if ext != None:
-                            n = f"{n}.{ext}"
-                        file_info['expected_name'] = n
-
                     if not sha1 in game_dict[game_id]['files']:
                         game_dict[game_id]['files'][sha1] = file_info
                     else:
                         fi = game_dict[game_id]['files'][sha1]
                         if fi['format'] != file_info['format']:
-                            if args.verbose:
+                            if verbose:
                                 print(f"WARNING: Inconsistend rom format in '[{game_id}] {full_name}'")
                                 print(f"  - ({fi['format']}/{file_info['format']})\n")
                             fi['format'] += "/" + file_info['format']
                             #raise Exception("Format mismatch")
-                        for r in file_info['regions']:
-                           if not r in fi['regions']:
-                               fi['regions'].append(r)
-                               fi['regions'].sort()
-                        for s in file_info['sections']:
-                           if not s in fi['sections']:
-                               fi['sections'].append(s)
-                               fi['sections'].sort()
+                        fi['regions'].update(file_info['regions'])
+                        fi['sections'].update(file_info['sections'])
                         if fi['rominfo'] == None:
                             fi['rominfo'] = rominfo
                         elif file_info['rominfo'] != None and fi['rominfo'] != file_info['rominfo']:
@@ -169,9 +239,24 @@ def build_game_dict(root, args):
                             print(f"  - ({fi['rominfo']}/{file_info['rominfo']})\n")
                             fi['rominfo'] += "/" + file_info['rominfo']
                     if not sha1 in sha1_to_game_id:
-                        sha1_to_game_id[sha1] = [game_id]
+                        sha1_to_game_id[sha1] = game_id
                     elif sha1_to_game_id[sha1] != game_id:
-                        sha1_to_game_id[sha1].append(game_id)
+                        game_ids = sha1_collisions.setdefault(sha1, [sha1_to_game_id[sha1]])
+                        if not game_id in game_ids:
+                            game_ids.append(game_id)
+                    if crc:
+                        # (CRC32, size) pairs shared by different ROMs can't be trusted
+                        crc_key = (int(crc, 16), file_size)
+                        if crc_to_sha1.get(crc_key, sha1) != sha1:
+                            crc_to_sha1[crc_key] = None
+                        else:
+                            crc_to_sha1[crc_key] = sha1
+
+    # Regions and sections are merged as sets while parsing
+    for info in game_dict.values():
+        for fi in info['files'].values():
+            fi['regions'] = sorted(fi['regions'])
+            fi['sections'] = sorted(fi['sections'])
 
     bad_clones = 0
     bad_clone_sources = 0
@@ -195,76 +280,149 @@ def build_game_dict(root, args):
             # Correct bad clone source reference
             info['clone'] = CONST_PARENT_CLONE
 
-    return game_dict, sha1_to_game_id, bad_clones
+    # The SHA1 mappings are read-only from here on
+    sha1_collisions = {sha1: tuple(game_ids) for sha1, game_ids in sha1_collisions.items()}
 
-def print_game_name_with_clones(game_dict, game_id, prefix):
-    info = game_dict[game_id]
-    print(f"{prefix}- [{game_id}] {info['full_name']}")
-    for clone_game_id in info['clones']:
-        print_game_name_with_clones(game_dict, clone_game_id, prefix + "  ")
+    return game_dict, sha1_to_game_id, sha1_collisions, crc_to_sha1, bad_clones
 
-def compute_sha1(data):
+def format_game_name_with_clones(game_dict, game_id, prefix):
+    lines = []
+    stack = [(game_id, prefix)]
+    while stack:
+        game_id, prefix = stack.pop()
+        info = game_dict[game_id]
+        lines.append(f"{prefix}- [{game_id}] {info['full_name']}")
+        stack.extend((clone_game_id, prefix + "  ") for clone_game_id in reversed(info['clones']))
+    return lines
+
+def compute_sha1_of_file(file):
+    if sys.version_info >= (3, 11):
+        return hashlib.file_digest(file, 'sha1').hexdigest()
     sha1 = hashlib.sha1()
-    sha1.update(data)
+    while chunk := file.read(1024 * 1024):
+        sha1.update(chunk)
     return sha1.hexdigest()
 
-def test_roms_package(package_path, sha1_to_game_id, game_dict):
-    tested_roms_count = 0
-    unknown_roms_count = 0
-    wrong_rom_names_count = 0
+def find_close_match(name, candidates):
+    if process != None:
+        match = process.extractOne(name, candidates, scorer=fuzz.ratio, score_cutoff=60)
+        return match[0] if match != None else None
+    close_matches = difflib.get_close_matches(name, candidates, n=1)
+    return close_matches[0] if len(close_matches) > 0 else None
+
+def find_roms_packages(directory):
+    sub_dirs = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            name = entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if name != '.db':
+                    sub_dirs.append(entry.path)
+            elif name.endswith('.zip'):
+                yield entry
+    for sub_dir in sub_dirs:
+        yield from find_roms_packages(sub_dir)
+
+def init_scan_worker(crc_to_sha1):
+    global g_crc_to_sha1
+    g_crc_to_sha1 = crc_to_sha1
+
+def scan_roms_package(package_path):
+    entries = []
     with zipfile.ZipFile(package_path, 'r') as zip_ref:
         for zip_info in zip_ref.infolist():
             if zip_info.is_dir():
                 continue
-            with zip_ref.open(zip_info) as file:
-                file_data = file.read()
-                sha1 = compute_sha1(file_data)
-                tested_roms_count += 1
-                if sha1 in sha1_to_game_id:
-                    actual_file_name = os.path.basename(zip_info.filename)
-                    game_ids = sha1_to_game_id[sha1]
-                    game_id = game_ids[0]
-                    if len(game_ids) > 1:
-                        ns = dict([(info['files'][sha1]['expected_name'], id) for id, info in game_dict.items() if id in game_ids])
-                        close_matches = difflib.get_close_matches(actual_file_name, ns.keys())
-                        if len(close_matches) > 0:
-                            game_id = ns[close_matches[0]]
-                        else:
-                            game_id = list(ns.values())[0]
+            # CRC32 and size come from the central directory, no need to decompress
+            sha1 = g_crc_to_sha1.get((zip_info.CRC, zip_info.file_size))
+            if sha1 == None:
+                with zip_ref.open(zip_info) as file:
+                    sha1 = compute_sha1_of_file(file)
+            entries.append((zip_info.filename, sha1))
+    return entries
+
+def test_roms_package(package_path, entries, sha1_to_game_id, sha1_collisions, game_dict):
+    tested_roms_count = 0
+    unknown_roms_count = 0
+    wrong_rom_names_count = 0
+    for file_name, sha1 in entries:
+        tested_roms_count += 1
+        if sha1 in sha1_to_game_id:
+            actual_file_name = os.path.basename(file_name)
+            game_id = sha1_to_game_id[sha1]
+            if sha1 in sha1_collisions:
+                ns = dict([(game_dict[id]['files'][sha1]['expected_name'], id) for id in sha1_collisions[sha1]])
+                close_match = find_close_match(actual_file_name, ns.keys())
+                if close_match != None:
+                    game_id = ns[close_match]
+                else:
+                    game_id = list(ns.values())[0]
 
-                    info = game_dict[game_id]
+            info = game_dict[game_id]
 
-                    # Update game's file info
-                    info['files'][sha1]['package_path'] = package_path
-                    info['files'][sha1]['file_name'] = zip_info.filename
+            # Update game's file info
+            info['files'][sha1]['package_path'] = package_path
+            info['files'][sha1]['file_name'] = file_name
 
-                    expected_file_name = info['files'][sha1]['expected_name']
+            expected_file_name = info['files'][sha1]['expected_name']
 
-                    if actual_file_name == expected_file_name:
-                        print(f"[+] {package_path}/{zip_info.filename}")
-                    else:
-                        wrong_rom_names_count += 1
-                        print(f"[~] {package_path}/{zip_info.filename}")
-                        print(f"  - Wrong file name. Expected '{expected_file_name}'")
-                else:
-                    unknown_roms_count += 1
-                    print(f"[-] {package_path}/{zip_info.filename}")
-                    print(f"  - Not found in the DB: {sha1}")
+            if actual_file_name == expected_file_name:
+                print(f"[+] {package_path}/{file_name}")
+            else:
+                wrong_rom_names_count += 1
+                print(f"[~] {package_path}/{file_name}")
+                print(f"  - Wrong file name. Expected '{expected_file_name}'")
+        else:
+            unknown_roms_count += 1
+            print(f"[-] {package_path}/{file_name}")
+            print(f"  - Not found in the DB: {sha1}")
 
     print()
     return tested_roms_count, unknown_roms_count, wrong_rom_names_count
 
-def export_file(package_path, file_name, export_dir, export_file_name):
+class ZipCache:
+    def __init__(self, max_open_files=64):
+        self.max_open_files = max_open_files
+        self.zip_refs = OrderedDict()
+
+    def get(self, package_path):
+        zip_ref = self.zip_refs.get(package_path)
+        if zip_ref != None:
+            self.zip_refs.move_to_end(package_path)
+            return zip_ref
+
+        # Keep the number of open file descriptors bounded
+        if len(self.zip_refs) >= self.max_open_files:
+            _, oldest_zip_ref = self.zip_refs.popitem(last=False)
+            oldest_zip_ref.close()
+
+        zip_ref = zipfile.ZipFile(package_path, 'r')
+        self.zip_refs[package_path] = zip_ref
+        return zip_ref
+
+    def close_all(self):
+        for zip_ref in self.zip_refs.values():
+            zip_ref.close()
+        self.zip_refs.clear()
+
+def export_file(zip_cache, package_path, file_name, export_dir, export_file_name):
     if not os.path.exists(export_dir):
         os.makedirs(export_dir)
 
     export_file_path = os.path.join(export_dir, export_file_name)
 
     print(f"Export: {export_file_path}")
-    with zipfile.ZipFile(package_path, 'r') as zip_ref:
-        with zip_ref.open(file_name) as source_file:
-            with open(export_file_path, 'wb') as target_file:
-                target_file.write(source_file.read())
+    with zip_cache.get(package_path).open(file_name) as source_file:
+        with open(export_file_path, 'wb', buffering=1024 * 1024) as target_file:
+            shutil.copyfileobj(source_file, target_file, 1024 * 1024)
+
+def get_abc_subdir(file_name):
+    for c in file_name:
+        if c.isalpha():
+            return c.upper()
+        if c.isdigit():
+            return '0-9'
+    return '-'
 
 def get_main_reg_subdir(regions, rest_of_the_world):
     if 'World' in regions:
@@ -296,44 +454,50 @@ def main():
 
     args = parser.parse_args()
 
-    archive_path = find_db_export_archive(os.path.join(args.directory, '.db'))
-    private_dat_archive_path = find_private_dat_archive(os.path.join(args.directory, '.db'))
-    xml_content = extract_xml_from_archive(archive_path)
-    root = parse_xml(xml_content)
-
-    game_dict, sha1_to_game_id, bad_clones = build_game_dict(root, args)
+    db_dir = os.path.join(args.directory, '.db')
+    db_archives, dat_archives = scan_db_directory(db_dir)
+    archive_path = find_db_export_archive(db_dir, db_archives)
+    private_dat_archive_path = find_private_dat_archive(db_dir, dat_archives)
+    with extract_xml_from_archive(archive_path) as xml_file:
+        game_dict, sha1_to_game_id, sha1_collisions, crc_to_sha1, bad_clones = build_game_dict(parse_xml(xml_file), args)
 
     if args.list:
+        out = []
         for game_id, info in game_dict.items():
             if info['clone'] == CONST_PARENT_CLONE:
-                print_game_name_with_clones(game_dict, game_id, "")
+                out.extend(format_game_name_with_clones(game_dict, game_id, ""))
+        if out:
+            sys.stdout.write('\n'.join(out) + '\n')
     print()
 
     if args.print:
+        out = []
         for game_id, info in game_dict.items():
-            print(f"[{game_id}] {info['full_name']}")
-            print(f"  - name:         {info['name']}")
-            print(f"  - languages:    {info['languages']}")
-            print(f"  - license:      {info['license']}")
-            print(f"  - regions:      {info['regions']}")
+            out.append(f"[{game_id}] {info['full_name']}")
+            out.append(f"  - name:         {info['name']}")
+            out.append(f"  - languages:    {info['languages']}")
+            out.append(f"  - license:      {info['license']}")
+            out.append(f"  - regions:      {info['regions']}")
 
             clone = info['clone']
             if clone == CONST_PARENT_CLONE:
-                print(f"  - clone:        {clone}")
+                out.append(f"  - clone:        {clone}")
             else:
-                print(f"  - clone:        [{clone}] ({game_dict[clone]['full_name']})")
-            print(f"  - clones:       {info['clones']}")
-            print(f"  - devstatus:    {info['devstatus']}")
-            print(f"  - bios:         {info['bios']}")
-            print(f"  - version1:     {info['version1']}")
-            print(f"  - version2:     {info['version2']}")
+                out.append(f"  - clone:        [{clone}] ({game_dict[clone]['full_name']})")
+            out.append(f"  - clones:       {info['clones']}")
+            out.append(f"  - devstatus:    {info['devstatus']}")
+            out.append(f"  - bios:         {info['bios']}")
+            out.append(f"  - version1:     {info['version1']}")
+            out.append(f"  - version2:     {info['version2']}")
             for sha1, f in info['files'].items():
-                print(f"  - file {sha1}:")
-                print(f"      - format:   {f['format']}")
-                print(f"      - exp_name: {f['expected_name']}")
-                print(f"      - regions:  {f['regions']}")
-                print(f"      - sections: {f['sections']}")
-                print(f"      - rominfo:  {f['rominfo']}")
+                out.append(f"  - file {sha1}:")
+                out.append(f"      - format:   {f['format']}")
+                out.append(f"      - exp_name: {f['expected_name']}")
+                out.append(f"      - regions:  {f['regions']}")
+                out.append(f"      - sections: {f['sections']}")
+                out.append(f"      - rominfo:  {f['rominfo']}")
+        if out:
+            sys.stdout.write('\n'.join(out) + '\n')
 
     if args.summary or args.print or args.list:
         unique_titles = 0
@@ -375,18 +539,20 @@ def main():
         wrong_rom_names_count = 0
         private_packages_ignored = 0
 
-        for root, dirs, files in os.walk(args.directory):
-            dirs[:] = [d for d in dirs if d != '.db']
-            for file in files:
-                if file.endswith('.zip'):
-                    zip_path = os.path.join(root, file)
-                    if not "Private" in file:
-                        trc, urc, wrc = test_roms_package(zip_path, sha1_to_game_id, game_dict)
-                    else:
-                        private_packages_ignored += 1
-                    tested_roms_count += trc
-                    unknown_roms_count += urc
-                    wrong_rom_names_count += wrc
+        zip_paths = []
+        for entry in find_roms_packages(args.directory):
+            if not "Private" in entry.name:
+                zip_paths.append(entry.path)
+            else:
+                private_packages_ignored += 1
+
+        # Decompression and hashing run in worker processes, DB lookups stay here
+        with ProcessPoolExecutor(initializer=init_scan_worker, initargs=(crc_to_sha1,)) as executor:
+            for zip_path, entries in zip(zip_paths, executor.map(scan_roms_package, zip_paths)):
+                trc, urc, wrc = test_roms_package(zip_path, entries, sha1_to_game_id, sha1_collisions, game_dict)
+                tested_roms_count += trc
+                unknown_roms_count += urc
+                wrong_rom_names_count += wrc
 
         print(f"Tested roms:          {tested_roms_count}")
         print(f"  - Unknown roms:     {unknown_roms_count}")
@@ -418,6 +584,7 @@ def main():
                 rest_of_the_world = other_regions[0]
 
         files_to_export = {}
+        dir_cache = {}
         exported_files = 0
         for game_id, info in game_dict.items():
             for _, f in info['files'].items():
@@ -425,37 +592,32 @@ def main():
                     target_file_name = f['expected_name']
 
                     # Figure out which sub-directories need to be added
-                    target_dir_path = export_path
+                    sub_dir_names = []
                     if args.split_bioses and info['bios']:
-                        target_dir_path = os.path.join(target_dir_path, 'BIOS')
+                        sub_dir_names.append('BIOS')
                     else:
                         if args.split_by_license:
-                            sub_dir_name = CONST_UNLICENSED
-                            if info['license'] == CONST_LICENSED:
-                                sub_dir_name = CONST_LICENSED
-                            target_dir_path = os.path.join(target_dir_path, sub_dir_name)
+                            sub_dir_names.append(CONST_LICENSED if info['license'] == CONST_LICENSED else CONST_UNLICENSED)
 
                         if args.split_by_size_32mb:
-                            sub_dir_name = 'Small'
                             if f['file_size'] > 32 * 1024 * 1024:
-                                sub_dir_name = "Large"
+                                sub_dir_names.append("Large")
                             elif args.split_by_main_reg:
-                                sub_dir_name = get_main_reg_subdir(info['regions'], rest_of_the_world)
-                            target_dir_path = os.path.join(target_dir_path, sub_dir_name)
+                                sub_dir_names.append(get_main_reg_subdir(info['regions'], rest_of_the_world))
+                            else:
+                                sub_dir_names.append('Small')
                         elif args.split_by_main_reg and info['license'] == CONST_LICENSED:
-                            sub_dir_name = get_main_reg_subdir(info['regions'], rest_of_the_world)
-                            target_dir_path = os.path.join(target_dir_path, sub_dir_name)
+                            sub_dir_names.append(get_main_reg_subdir(info['regions'], rest_of_the_world))
 
                         if args.split_by_abc:
-                            sub_dir_name = '-'
-                            for c in target_file_name:
-                                if c.isalpha():
-                                    sub_dir_name = c.upper()
-                                    break
-                                if c.isdigit():
-                                    sub_dir_name = '0-9'
-                                    break
-                            target_dir_path = os.path.join(target_dir_path, sub_dir_name)
+                            sub_dir_names.append(get_abc_subdir(target_file_name))
+
+                    # Identical sub-directory combinations share one joined path
+                    sub_dirs_key = tuple(sub_dir_names)
+                    target_dir_path = dir_cache.get(sub_dirs_key)
+                    if target_dir_path == None:
+                        target_dir_path = os.path.join(export_path, *sub_dirs_key)
+                        dir_cache[sub_dirs_key] = target_dir_path
 
                     # Add the ROM to the export list
                     if not target_dir_path in files_to_export:
@@ -466,11 +628,13 @@ def main():
                         "file_name": f['file_name'],
                         "target_file_name": target_file_name
                     })
+        zip_cache = ZipCache()
         for target_dir_path, files_list in sorted(files_to_export.items()):
             sorted_files_list = sorted(files_list, key=lambda x: x['target_file_name'].lower())
             for f in sorted_files_list:
-                export_file(f['package_path'], f['file_name'], target_dir_path, f['target_file_name'])
+                export_file(zip_cache, f['package_path'], f['file_name'], target_dir_path, f['target_file_name'])
                 exported_files += 1
+        zip_cache.close_all()
         print()
 
         print(f"Files exported: {exported_files}\n")
@@ -1,14 +1,22 @@
 #!/usr/bin/python3
 
 import argparse
+import asyncio
 import datetime
+import errno
 import exifread
-import glob
+import io
+import mmap
+import multiprocessing.util
 import os.path
+import platform
 import shutil
+import sqlite3
 import struct
 import subprocess
 import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 g_config_verbose  = False
 g_config_dry_run  = False
@@ -17,66 +25,218 @@ g_config_ffprobe  = False
 g_config_dune     = False
 g_config_skip_dune = False
 g_config_conversion_preset = "fast"
-
-def get_date_by_exiftool(file_path, date_name):
-    output = subprocess.check_output(['exiftool',
-                                      '-ee',
-                                      f'-time:{date_name}',
-                                      file_path])
-    substrs = output.split(b': ')
-
-    if len(substrs) < 2:
-        if g_config_verbose:
-            print("Can't parse exiftool output. Make sure it is installed")
-        return None
-
-    substrs2 = substrs[1][:19].split(b'+')
-
-    if len(substrs2) != 2 and len(substrs2) != 1:
+g_config_jobs = min(8, os.cpu_count() or 1)
+g_config_cache = True
+g_config_cpu_encode = False
+g_config_fast_scan = False
+g_config_cache_path = os.path.expanduser('~/.cache/photolib-tool/dates.db')
+
+g_exiftool_daemon = None
+g_pending_gps_copies = []
+g_date_cache = None
+g_video_encoder = 'libx264'
+g_video_encoder_settings = None
+g_cross_device_moves = set()
+
+EXIFTOOL_DATE_TRANSLATION = bytes.maketrans(b':', b'-')
+FFPROBE_DATE_TRANSLATION = bytes.maketrans(b':T', b'- ')
+
+def parse_exiftool_date(value):
+    # Convert from b'2016:03:09 05:47:50+02:00'
+    #           to '2016-03-09 05-47-50'
+    try:
+        return value[:19].partition(b'+')[0].strip().translate(EXIFTOOL_DATE_TRANSLATION).decode("ascii")
+    except UnicodeDecodeError:
         if g_config_verbose:
             print("Can't parse exiftool output. Make sure it is installed")
         return None
 
-    return substrs2[0].strip().decode("utf-8").replace(':', '-')
+class ExiftoolDaemon:
+    def __init__(self):
+        # One exiftool process serves all requests via '-stay_open'
+        args = ['exiftool', '-stay_open', 'True', '-@', '-']
+        if platform.system() == 'Windows':
+            # File names are passed in UTF-8, not in the system code page
+            args += ['-charset', 'filename=utf8']
+        self.process = subprocess.Popen(args,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+
+    def execute(self, *args):
+        # Arguments are read one per line, a line break would split them
+        if any('\n' in arg for arg in args):
+            print(f"WARNING: can't pass a line break to exiftool: {args[-1]!r}")
+            return []
+
+        # Encode like subprocess does for argv, to keep non-UTF-8 file names
+        self.process.stdin.write(b'\n'.join([os.fsencode(arg) for arg in args + ('-execute', '')]))
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line or line.startswith(b'{ready'):
+                break
+            output.append(line.rstrip(b'\r\n'))
+        return output
+
+    def get_dates(self, file_path, *date_names):
+        output = self.execute('-ee', '-S', *[f'-time:{date_name}' for date_name in date_names], file_path)
+
+        dates = {}
+        for line in output:
+            name, separator, value = line.partition(b': ')
+            if not separator:
+                if g_config_verbose:
+                    print("Can't parse exiftool output. Make sure it is installed")
+                continue
+            dates[name.decode("utf-8")] = parse_exiftool_date(value)
+        return dates
+
+    def close(self):
+        self.process.stdin.write(b'-stay_open\nFalse\n')
+        self.process.stdin.flush()
+        self.process.wait()
+
+def get_exiftool_daemon():
+    global g_exiftool_daemon
+
+    if not g_exiftool_daemon:
+        g_exiftool_daemon = ExiftoolDaemon()
+    return g_exiftool_daemon
+
+def copy_pending_gps_tags():
+    if not g_pending_gps_copies:
+        return
+
+    exiftool_daemon = get_exiftool_daemon()
+    for (source, target) in g_pending_gps_copies:
+        output = exiftool_daemon.execute('-ee', '-tagsfromfile', source, '-gps*', target)
+        # A source without GPS tags leaves the target unchanged, that's fine
+        if not output or any(b"weren't updated due to errors" in line for line in output):
+            print(f'WARNING: failed to copy GPS tags to {target}')
+    g_pending_gps_copies.clear()
+
+def close_exiftool_daemon():
+    global g_exiftool_daemon
+
+    if g_exiftool_daemon:
+        g_exiftool_daemon.close()
+        g_exiftool_daemon = None
 
 def get_date_by_ffprobe(file_path):
-    output = subprocess.check_output(['ffprobe',
-                                      '-v', 'quiet',
-                                      '-select_streams', 'v:0',
-                                      '-show_entries', 'stream_tags=creation_time',
-                                      '-of', 'default=noprint_wrappers=1:nokey=1',
-                                      file_path])
+    output = subprocess.run(['ffprobe',
+                             '-v', 'quiet',
+                             '-select_streams', 'v:0',
+                             '-show_entries', 'stream_tags=creation_time',
+                             '-of', 'default=noprint_wrappers=1:nokey=1',
+                             file_path],
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            check=True).stdout
 
     try:
         # Convert from b'2016-03-09T05:47:50.000000Z\n'
-        #           to '2016-03-09 05:47:50'
-        return output.split(b'.')[0].decode("utf-8").replace(':', '-').replace('T', ' ')
+        #           to '2016-03-09 05-47-50'
+        return output.partition(b'.')[0].translate(FFPROBE_DATE_TRANSLATION).decode("ascii")
     except Exception as e:
         return None
 
-def get_rotation_by_ffprobe(file_path):
-    output = subprocess.check_output(['ffprobe',
-                                      '-v', 'quiet',
-                                      '-select_streams', 'v',
-                                      '-show_entries', 'stream_side_data=rotation',
-                                      '-of', 'default=noprint_wrappers=1:nokey=1',
-                                      file_path])
+async def check_output_async(args):
+    process = await asyncio.create_subprocess_exec(*args,
+                                                   stdout=subprocess.PIPE,
+                                                   stderr=subprocess.DEVNULL)
+    (output, _) = await process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, output)
+    return output
+
+async def get_rotation_by_ffprobe(file_path):
+    output = await check_output_async(['ffprobe',
+                                       '-v', 'quiet',
+                                       '-select_streams', 'v',
+                                       '-show_entries', 'stream_side_data=rotation',
+                                       '-of', 'default=noprint_wrappers=1:nokey=1',
+                                       file_path])
     return output.decode("utf-8").strip()
 
-def get_codec_by_ffprobe(file_path, stream_name):
-    output = subprocess.check_output(['ffprobe',
-                                      '-v', 'quiet',
-                                      '-select_streams', stream_name,
-                                      '-show_entries', 'stream=codec_name',
-                                      '-of', 'default=noprint_wrappers=1:nokey=1',
-                                      file_path])
+async def get_codec_by_ffprobe(file_path, stream_name):
+    output = await check_output_async(['ffprobe',
+                                       '-v', 'quiet',
+                                       '-select_streams', stream_name,
+                                       '-show_entries', 'stream=codec_name',
+                                       '-of', 'default=noprint_wrappers=1:nokey=1',
+                                       file_path])
     return output.decode("utf-8").strip()
 
+async def get_av_info_by_ffprobe(file_path):
+    # The three ffprobe processes are independent, run them concurrently
+    return await asyncio.gather(get_codec_by_ffprobe(file_path, 'a'),
+                                get_codec_by_ffprobe(file_path, 'v'),
+                                get_rotation_by_ffprobe(file_path))
+
+# Preferred hardware H.264 encoders and their quality settings
+HARDWARE_VIDEO_ENCODERS = {
+    'Darwin':  ['h264_videotoolbox'],
+    'Linux':   ['h264_nvenc', 'h264_qsv'],
+    'Windows': ['h264_nvenc', 'h264_qsv'],
+}
+HARDWARE_VIDEO_ENCODER_SETTINGS = {
+    'h264_nvenc':        ['-cq', '20'],
+    'h264_videotoolbox': ['-q:v', '60'],
+    'h264_qsv':          ['-global_quality', '20'],
+}
+
+def is_video_encoder_usable(video_settings):
+    # An encoder can be compiled in while the hardware (or driver) is missing,
+    # or support only some of the settings (e.g. '-q:v' on Intel Macs)
+    result = subprocess.run(['ffmpeg',
+                             '-hide_banner',
+                             '-loglevel', 'error',
+                             '-f', 'lavfi',
+                             '-i', 'color=size=256x256:duration=0.1'] +
+                            video_settings +
+                            ['-f', 'null', '-'],
+                            stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def select_video_encoder():
+    global g_video_encoder
+    global g_video_encoder_settings
+
+    g_video_encoder = 'libx264'
+    g_video_encoder_settings = ['-codec:v', 'libx264', '-crf', '18', '-preset', g_config_conversion_preset]
+
+    if g_config_cpu_encode:
+        return
+
+    try:
+        output = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                stdin=subprocess.DEVNULL,
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return
+
+    available_encoders = {line.split()[1] for line in output.splitlines() if len(line.split()) > 1}
+
+    for encoder in HARDWARE_VIDEO_ENCODERS.get(platform.system(), []):
+        if not encoder in available_encoders:
+            continue
+        video_settings = ['-codec:v', encoder] + HARDWARE_VIDEO_ENCODER_SETTINGS[encoder]
+        if is_video_encoder_usable(video_settings):
+            g_video_encoder = encoder
+            g_video_encoder_settings = video_settings
+            return
+
 def fix_by_ffmpeg(source, target, skip_video_conversion=False):
     if not os.path.exists(target):
-        audio_codec = get_codec_by_ffprobe(source, 'a')
-        video_codec = get_codec_by_ffprobe(source, 'v')
-        rotation = get_rotation_by_ffprobe(source)
+        (audio_codec, video_codec, rotation) = asyncio.run(get_av_info_by_ffprobe(source))
 
         # Files with codecs that contain '\n' are written by Panasonic camera
         dune_video_codecs = ['h264', 'h264\nh264']
@@ -101,7 +261,7 @@ def fix_by_ffmpeg(source, target, skip_video_conversion=False):
             if skip_video_conversion:
                 return True
             else:
-                video_settings = ['-codec:v', 'libx264', '-crf', '18', '-preset', g_config_conversion_preset]
+                video_settings = g_video_encoder_settings
                 fix_video = True
 
         if not fix_video and not fix_audio:
@@ -116,92 +276,140 @@ def fix_by_ffmpeg(source, target, skip_video_conversion=False):
                                      '-i', source,
                                      '-map_metadata', '0'] + audio_settings + video_settings + [target])
 
-            subprocess.check_output(['exiftool',
-                                     '-ee',
-                                     '-tagsfromfile', source,
-                                     '-gps*',
-                                     target])
-
             move_file(source, target + '.orig.mov')
 
+            # GPS tags are copied for the whole batch by copy_pending_gps_tags()
+            g_pending_gps_copies.append((target + '.orig.mov', target))
+
         return True
     else:
         print(f'Cannot move {source} to {target}')
         return False
 
-def mov_creation_date(file_path):
-    if g_config_ffprobe:
-        return get_date_by_ffprobe(file_path)
-
-    if g_config_exiftool:
-        original_Date_time = get_date_by_exiftool(file_path, 'DateTimeOriginal')
-        if original_Date_time:
-            return original_Date_time
-
-        creation_date = get_date_by_exiftool(file_path, 'CreationDate')
-        if creation_date:
-            return creation_date
-
-        return get_date_by_exiftool(file_path, 'CreateDate')
-
+def get_mov_dates_by_exiftool(file_path):
+    # All the dates are queried at once in a single exiftool request
+    return get_exiftool_daemon().get_dates(file_path,
+                                           'DateTimeOriginal',
+                                           'CreationDate',
+                                           'CreateDate')
 
+def get_date_by_mvhd(file_path):
     ATOM_HEADER_SIZE = 8
 
     # difference between Unix epoch and QuickTime epoch, in seconds
     EPOCH_ADJUSTER = 2082844800
 
-    # open file and search for moov item
-    f = open(file_path, "rb")
-    while 1:
-        atom_header = f.read(ATOM_HEADER_SIZE)
-        if atom_header[4:8] == b'moov':
-            break
-        else:
-            if len(atom_header) < 4:
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < ATOM_HEADER_SIZE:
+            if g_config_verbose:
+                print("Can't read atom header: end of file")
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with mm:
+        # Only a few atom headers are touched, don't read ahead through 'mdat'
+        if hasattr(mmap, 'MADV_RANDOM'):
+            mm.madvise(mmap.MADV_RANDOM)
+
+        # search for moov item
+        file_size = len(mm)
+        offset = 0
+        while 1:
+            if offset + ATOM_HEADER_SIZE > file_size:
                 if g_config_verbose:
                     print("Can't read atom header: end of file")
                 return None
 
-            atom_size = struct.unpack(">I", atom_header[0:4])[0]
-            f.seek(atom_size - 8, 1)
+            (atom_size, atom_name) = struct.unpack_from(">I4s", mm, offset)
+            if atom_name == b'moov':
+                break
 
-    # found 'moov', look for 'mvhd' and timestamps
-    atom_header = f.read(ATOM_HEADER_SIZE)
+            if atom_size == 1 and offset + 16 <= file_size:
+                # 64-bit extended atom size
+                atom_size = struct.unpack_from(">Q", mm, offset + 8)[0]
+            if atom_size < ATOM_HEADER_SIZE:
+                if g_config_verbose:
+                    print(f"Unsupported atom size {atom_size}")
+                return None
+            offset += atom_size
 
-    atom_header_name = atom_header[4:8]
+        # found 'moov', look for 'mvhd' and timestamps
+        atom_header = mm[offset + ATOM_HEADER_SIZE:offset + 2 * ATOM_HEADER_SIZE]
 
-    if atom_header_name == b'cmov':
-        if g_config_verbose:
-            print("moov atom is compressed")
-        return None
-    elif atom_header_name != b'mvhd':
-        if g_config_verbose:
-            print(f"expected to find 'mvhd' header, found '{atom_header}'")
-        return None
-    else:
-        f.seek(4, 1)
-        buf = f.read(4)
+        atom_header_name = atom_header[4:8]
 
-        if len(buf) < 4:
+        if atom_header_name == b'cmov':
             if g_config_verbose:
-                print("Can't read creation date: end of file")
+                print("moov atom is compressed")
             return None
+        elif atom_header_name != b'mvhd':
+            if g_config_verbose:
+                print(f"expected to find 'mvhd' header, found '{atom_header}'")
+            return None
+        else:
+            # skip version and flags, version 1 uses 64-bit timestamps
+            if offset + 2 * ATOM_HEADER_SIZE + 1 > file_size:
+                if g_config_verbose:
+                    print("Can't read creation date: end of file")
+                return None
 
-        creation_date = datetime.datetime.utcfromtimestamp(
-                            struct.unpack(">I", buf)[0] - EPOCH_ADJUSTER)
-        # modification_date = struct.unpack(">I", f.read(4))[0]
+            creation_date_offset = offset + 2 * ATOM_HEADER_SIZE + 4
+            creation_date_format = ">Q" if mm[creation_date_offset - 4] == 1 else ">I"
 
-        return str(creation_date).replace(':', '-')
+            if creation_date_offset + struct.calcsize(creation_date_format) > file_size:
+                if g_config_verbose:
+                    print("Can't read creation date: end of file")
+                return None
 
-def jpg_creation_date(file_path):
-    f = open(file_path, 'rb')
+            creation_timestamp = struct.unpack_from(creation_date_format, mm, creation_date_offset)[0]
+            if creation_timestamp == 0:
+                if g_config_verbose:
+                    print("mvhd creation date is not set")
+                return None
+
+            creation_date = datetime.datetime.utcfromtimestamp(creation_timestamp - EPOCH_ADJUSTER)
+            # modification_date = struct.unpack_from(">I", mm, creation_date_offset + 4)[0]
+
+            return str(creation_date).replace(':', '-')
+
+
+def mov_creation_date(file_path):
+    if g_config_ffprobe:
+        return get_date_by_ffprobe(file_path)
+
+    if g_config_fast_scan or not g_config_exiftool:
+        creation_date = get_date_by_mvhd(file_path)
+        if creation_date or not g_config_exiftool:
+            return creation_date
+
+    dates = get_mov_dates_by_exiftool(file_path)
+    return dates.get('DateTimeOriginal') or dates.get('CreationDate') or dates.get('CreateDate')
 
-    tags = exifread.process_file(f)
+JPG_HEADER_SIZE = 128 * 1024
 
-    f.close()
+def get_jpg_exif_tags(f):
+    # Skip MakerNote parsing and stop as soon as the date is found
+    return exifread.process_file(f,
+                                 details=False,
+                                 stop_tag='DateTimeOriginal',
+                                 strict=False)
 
+def jpg_creation_date(file_path):
     date_time_tag = 'EXIF DateTimeOriginal'
 
+    with open(file_path, 'rb') as f:
+        # The EXIF segment is at the beginning of the file, so usually there
+        # is no need to read the rest of it
+        header = f.read(JPG_HEADER_SIZE)
+        try:
+            tags = get_jpg_exif_tags(io.BytesIO(header))
+        except Exception:
+            tags = {}
+
+        if not date_time_tag in tags and len(header) == JPG_HEADER_SIZE:
+            f.seek(0)
+            tags = get_jpg_exif_tags(f)
+
     if date_time_tag in tags:
       return str(tags[date_time_tag]).replace(':', '-')
 
@@ -210,75 +418,206 @@ def jpg_creation_date(file_path):
 def move_file(source, target):
     print(f'{source} -> {target}')
     if not g_config_dry_run:
+        dir_paths = (os.path.dirname(source), os.path.dirname(target))
+
+        # A plain rename is enough unless the file has to go to another
+        # filesystem, which is remembered per pair of directories
+        if not dir_paths in g_cross_device_moves:
+            try:
+                os.rename(source, target)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                g_cross_device_moves.add(dir_paths)
+
         shutil.move(source, target)
 
-def find_files(input_paths, *masks):
-    return list(filter(lambda p: os.path.isfile(p), input_paths)) + \
+def walk_files(dir_path, exts):
+    sub_dir_paths = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            # Hidden entries are skipped, same as glob does
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                sub_dir_paths.append(entry.path)
+            else:
+                (_, dot, ext) = entry.name.rpartition('.')
+                if dot and ext.lower() in exts:
+                    # Keep the stat result so the file isn't stat'ed again later
+                    yield (entry.path, entry.stat())
+
+    for sub_dir_path in sub_dir_paths:
+        yield from walk_files(sub_dir_path, exts)
+
+def find_files(input_paths, exts):
+    return [(p, os.stat(p)) for p in filter(lambda p: os.path.isfile(p), input_paths)] + \
            [input_file for input_dir in filter(lambda p: os.path.isdir(p), input_paths)
-                              for mask in masks
-                              for input_file
-                                  in glob.iglob(input_dir + '/**/' + mask,
-                                                recursive=True)]
+                              for input_file in walk_files(input_dir, exts)]
+
+class DateCache:
+    def __init__(self, cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.db = sqlite3.connect(cache_path)
+        # It's only a cache, losing it on a crash is fine
+        self.db.execute('PRAGMA synchronous=OFF')
+        self.db.execute('PRAGMA journal_mode=MEMORY')
+        self.db.execute('CREATE TABLE IF NOT EXISTS dates('
+                        'path TEXT PRIMARY KEY, method TEXT, mtime INTEGER, size INTEGER, date TEXT)')
+
+    def lookup(self, file_path, method, file_stat):
+        row = self.db.execute('SELECT date FROM dates WHERE path=? AND method=? AND mtime=? AND size=?',
+                              (file_path, method, file_stat.st_mtime_ns, file_stat.st_size)).fetchone()
+        return (row != None, row[0] if row else None)
+
+    def store(self, rows):
+        self.db.executemany('INSERT OR REPLACE INTO dates VALUES (?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+
+    def rename(self, renamings):
+        self.db.executemany('UPDATE OR REPLACE dates SET path=? WHERE path=?', renamings)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+def init_probe_worker(verbose, exiftool, ffprobe, fast_scan):
+    global g_config_verbose
+    global g_config_exiftool
+    global g_config_ffprobe
+    global g_config_fast_scan
+
+    g_config_verbose = verbose
+    g_config_exiftool = exiftool
+    g_config_ffprobe = ffprobe
+    g_config_fast_scan = fast_scan
+
+    # Pool workers exit without running atexit handlers
+    multiprocessing.util.Finalize(None, close_exiftool_daemon, exitpriority=10)
+
+def get_probe_method(extract_creation_date):
+    # Different tools may report different dates for the same file
+    if g_config_ffprobe:
+        tool = 'ffprobe'
+    elif g_config_fast_scan:
+        tool = 'fast'
+    elif g_config_exiftool:
+        tool = 'exiftool'
+    else:
+        tool = 'builtin'
+    return f'{extract_creation_date.__name__}:{tool}'
+
+def extract_creation_dates(file_paths, extract_creation_date):
+    if g_config_jobs <= 1 or len(file_paths) <= 1:
+        yield from map(extract_creation_date, file_paths)
+        return
+
+    # Metadata extraction mostly waits on exiftool/ffprobe and disk reads
+    with ProcessPoolExecutor(max_workers=g_config_jobs,
+                             initializer=init_probe_worker,
+                             initargs=(g_config_verbose,
+                                       g_config_exiftool,
+                                       g_config_ffprobe,
+                                       g_config_fast_scan)) as executor:
+        yield from executor.map(extract_creation_date, file_paths, chunksize=32)
+
+def probe_files(input_files, extract_creation_date):
+    method = get_probe_method(extract_creation_date)
+
+    missed_files = []
+    for (file_path, file_stat) in input_files:
+        if g_date_cache:
+            (found, creation_date) = g_date_cache.lookup(os.path.abspath(file_path), method, file_stat)
+            if found:
+                yield (file_path, file_stat.st_size, creation_date)
+                continue
+        missed_files.append((file_path, file_stat))
+
+    new_cache_rows = []
+    missed_file_paths = [file_path for (file_path, _) in missed_files]
+    for ((file_path, file_stat), creation_date) in zip(missed_files,
+            extract_creation_dates(missed_file_paths, extract_creation_date)):
+        # Failures may be temporary, don't pin them to the file
+        if creation_date != None:
+            new_cache_rows.append((os.path.abspath(file_path), method, file_stat.st_mtime_ns, file_stat.st_size, creation_date))
+        yield (file_path, file_stat.st_size, creation_date)
+
+    if g_date_cache and new_cache_rows:
+        g_date_cache.store(new_cache_rows)
 
 def process_files(input_files, extract_creation_date, ext, output_path, fix_av_codecs):
-    all_files = {}
+    all_files = defaultdict(list)
+    cache_renamings = []
 
     processed_files_count = 0
 
+    total_files_count = len(input_files)
     checked_files_count = 0
-    for input_file_path in input_files:
-        creation_date = extract_creation_date(input_file_path)
-        if not creation_date in all_files:
-            all_files[creation_date] = []
-        all_files[creation_date].append(
-            (input_file_path, os.path.getsize(input_file_path)))
+    for (input_file_path, file_size, creation_date) in probe_files(input_files, extract_creation_date):
+        all_files[creation_date].append((input_file_path, file_size))
         checked_files_count += 1
-        print(f'{checked_files_count}/{len(input_files)} checked')
+        if checked_files_count == total_files_count:
+            print(f'{checked_files_count}/{total_files_count} checked')
+        elif checked_files_count % 100 == 0:
+            # Keep updating the same line in a terminal
+            sys.stdout.write(f'{checked_files_count}/{total_files_count} checked\r')
+            sys.stdout.flush()
 
-    files_count = 0
-    for (creation_date, same_creation_date_files) in all_files.items():
-        files_count += 1
-        print(f'[{files_count}/{len(all_files.items())}] {input_file_path}')
+    if output_path:
+        os.makedirs(output_path, exist_ok=True)
 
-        if not creation_date:
+    try:
+        all_dates = list(all_files.items())
+        dates_count = len(all_dates)
+        for (files_count, (creation_date, same_creation_date_files)) in enumerate(all_dates, 1):
+            print(f'[{files_count}/{dates_count}] {creation_date or "unknown creation date"}')
+
+            if not creation_date:
+                for (input_file_path, _) in same_creation_date_files:
+                    print(f'Warning: unknown creation date: {input_file_path}')
+                continue
+
+            # Sort from larger to smaller so untrimmed and higher resolution files
+            # will come first in the list
+            if len(same_creation_date_files) > 1:
+                same_creation_date_files.sort(key=lambda tup: tup[1], reverse = True)
+
+            count = 0
             for (input_file_path, _) in same_creation_date_files:
-                print(f'Warning: unknown creation date: {input_file_path}')
-            continue
-
-        # Sort from larger to smaller so untrimmed and higher resolution files
-        # will come first in the list
-        same_creation_date_files.sort(key=lambda tup: tup[1], reverse = True)
+                (dir_path, input_file) = os.path.split(input_file_path)
 
-        count = 0
-        for (input_file_path, _) in same_creation_date_files:
-            (dir_path, input_file) = os.path.split(input_file_path)
+                suffix = f' ({count})' if count > 0 else ''
 
-            suffix = f' ({count})' if count > 0 else ''
-
-            if output_path:
-                if not os.path.exists(output_path):
-                    os.mkdir(output_path)
-
-                output_file_path = os.path.join(output_path,
-                                                f'{creation_date}{suffix}.{ext}')
-            else:
-                output_file_path = os.path.join(dir_path,
-                                                f'{creation_date}{suffix}.{ext}')
+                if output_path:
+                    output_file_path = os.path.join(output_path,
+                                                    f'{creation_date}{suffix}.{ext}')
+                else:
+                    output_file_path = os.path.join(dir_path,
+                                                    f'{creation_date}{suffix}.{ext}')
 
 
-            if os.path.exists(output_file_path):
-                if input_file_path != output_file_path:
-                    print(f'Cannot move {input_file_path} to {output_file_path}')
-            else:
-                if fix_av_codecs:
-                    if not fix_by_ffmpeg(input_file_path, output_file_path, g_config_skip_dune):
-                        move_file(input_file_path, output_file_path)
+                if os.path.exists(output_file_path):
+                    if input_file_path != output_file_path:
+                        print(f'Cannot move {input_file_path} to {output_file_path}')
                 else:
-                    move_file(input_file_path, output_file_path)
+                    if fix_av_codecs:
+                        if not fix_by_ffmpeg(input_file_path, output_file_path, g_config_skip_dune):
+                            move_file(input_file_path, output_file_path)
+                    else:
+                        move_file(input_file_path, output_file_path)
+                        cache_renamings.append((os.path.abspath(output_file_path),
+                                                os.path.abspath(input_file_path)))
+
+                    processed_files_count += 1
 
-                processed_files_count += 1
+                count += 1
+    finally:
+        copy_pending_gps_tags()
+        close_exiftool_daemon()
 
-            count += 1
+    if g_date_cache and cache_renamings and not g_config_dry_run:
+        g_date_cache.rename(cache_renamings)
 
     print(f'Processed {processed_files_count} file(s)')
 
@@ -290,6 +629,11 @@ def main():
     global g_config_dune
     global g_config_skip_dune
     global g_config_conversion_preset
+    global g_config_jobs
+    global g_config_cache
+    global g_config_cpu_encode
+    global g_config_fast_scan
+    global g_date_cache
 
     parser = argparse.ArgumentParser(
         description='My photo library maintenance tool')
@@ -308,6 +652,9 @@ def main():
                         help='dry run, print what is going to be done and exit')
     parser.add_argument('--no-exiftool', action="store_true", default=not g_config_exiftool,
                         help='don\'t use system exiftool (if not installed)')
+    parser.add_argument('--fast-scan', action="store_true", default=g_config_fast_scan,
+                        help='read mov creation dates from the mvhd atom (UTC) and use exiftool '
+                             'only when it is missing')
     parser.add_argument('--ffprobe', action="store_true", default=g_config_ffprobe,
                         help='use system ffprobe tool')
     parser.add_argument('--dune', action="store_true", default=g_config_dune,
@@ -316,8 +663,14 @@ def main():
                         help='skip files that cannot be playable by Dune HD H1 player')
     parser.add_argument('--preset', action="store", dest="preset", type=str,
                         help='video conversion preset for Dune HD H1 player')
+    parser.add_argument('--cpu-encode', action="store_true", default=g_config_cpu_encode,
+                        help='always use libx264 for video conversion, even if a hardware encoder is available')
     parser.add_argument('--output', action="store", dest="output_dir", type=str,
                         help='the output directory path')
+    parser.add_argument('--jobs', action="store", dest="jobs", type=int, default=g_config_jobs,
+                        help='number of parallel metadata readers (use 1 or 2 for HDDs)')
+    parser.add_argument('--no-cache', action="store_true", default=not g_config_cache,
+                        help=f'don\'t use the creation date cache ({g_config_cache_path})')
 
     args = parser.parse_args()
 
@@ -332,12 +685,19 @@ def main():
     g_config_ffprobe = args.ffprobe
     g_config_dune = args.dune or args.skip_dune
     g_config_skip_dune = args.skip_dune
+    g_config_cpu_encode = args.cpu_encode
+    g_config_fast_scan = args.fast_scan
+    g_config_jobs = args.jobs
+    g_config_cache = not args.no_cache
 
     if args.preset != None:
         g_config_conversion_preset = args.preset
 
     if g_config_dune:
-        print(f'Video conversion preset: {g_config_conversion_preset}')
+        select_video_encoder()
+        print(f'Video encoder: {g_video_encoder}')
+        if g_video_encoder == 'libx264':
+            print(f'Video conversion preset: {g_config_conversion_preset}')
 
     input_paths = [os.path.normpath(p) for p in args.input_paths]
 
@@ -348,10 +708,13 @@ def main():
         for bad_input_dir in bad_input_paths:
             print(f"  - {bad_input_dir}")
 
+    if g_config_cache:
+        g_date_cache = DateCache(g_config_cache_path)
+
     all_formats = not args.mov or not args.jpg
 
     if args.mov or all_formats:
-        mov_files = find_files(input_paths, '*.mov', '*.MOV', '*.mp4', '*.MP4', '*.3gp', '*.3GP', '*.MTS', '*.mts')
+        mov_files = find_files(input_paths, {'mov', 'mp4', '3gp', 'mts'})
 
         if g_config_verbose:
             print(f'Found {len(mov_files)} mov file(s)')
@@ -359,11 +722,15 @@ def main():
         process_files(mov_files, mov_creation_date, 'mov', args.output_dir, g_config_dune)
 
     if args.jpg or all_formats:
-        jpg_files = find_files(input_paths, '*.jpg', '*.jpeg', '*.JPG', '*.JPEG')
+        jpg_files = find_files(input_paths, {'jpg', 'jpeg'})
 
         if g_config_verbose:
             print(f'Found {len(jpg_files)} JPEG file(s)')
 
         process_files(jpg_files, jpg_creation_date, 'jpg', args.output_dir, False)
 
-main()
+    if g_date_cache:
+        g_date_cache.close()
+
+if __name__ == "__main__":
+    main()
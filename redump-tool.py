@@ -1,12 +1,30 @@
 #!/usr/bin/python3
 
 import argparse
+import functools
 import hashlib
+import mmap
 import os
+import re
 import shutil
-import xml.etree.ElementTree as ET
+import sqlite3
+import ssl
+import sys
 import zipfile
 import difflib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import lxml.etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    process = None
 
 def main():
     parser = argparse.ArgumentParser(description="Command line tool to maintain Redump image set.")
@@ -16,73 +34,70 @@ def main():
     parser.add_argument('--dry', action='store_true', help="Perform dry run (no actual changes).")
     parser.add_argument('--test', action='store_true', help="Test the library (no check sums).")
     parser.add_argument('--test-full', action='store_true', help="Test the library (with check sums).")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the check sums cache.")
+    parser.add_argument('--jobs', type=int, default=min(8, os.cpu_count() or 1),
+                        help="Number of files to hash in parallel (use 1 or 2 for HDDs).")
 
     args = parser.parse_args()
 
     archive_path = find_db_export_archive('.db')
-    xml_content = extract_dat_from_archive(archive_path)
-    root = ET.fromstring(xml_content)
-
-    print_header(root)
+    (games_data, sha1_to_games, header) = load_games_data_from_db(archive_path, args)
 
-    games_data = load_games_data_from_db(root, args)
+    print_header(header)
+    print(f"SHA-1 backend: {get_sha1_backend_name()}")
 
     print(f"{len(games_data)} disk images in the databases")
 
-    if args.test:
-        test_library(games_data, False, ".")
+    hash_cache = None
+    if not args.no_cache:
+        hash_cache = HashCache(os.path.join('.db', 'sha1-cache.sqlite'))
 
-    if args.test_full:
-        test_library(games_data, True, ".")
+    try:
+        if args.test:
+            test_library(games_data, False, ".", hash_cache, args.jobs)
 
-    if args.test_import:
-        test_library(games_data, True, args.test_import)
+        if args.test_full:
+            test_library(games_data, True, ".", hash_cache, args.jobs)
 
-    if args.import_from:
-        games_data_to_import = load_games_data_to_import(args.import_from)
-        print(f"{len(games_data_to_import)} games to import")
+        if args.test_import:
+            test_library(games_data, True, args.test_import, hash_cache, args.jobs)
 
-        import_games(games_data_to_import, games_data, args.dry)
+        if args.import_from:
+            games_data_to_import = load_games_data_to_import(args.import_from, hash_cache, args.jobs)
+            print(f"{len(games_data_to_import)} games to import")
 
-def test_library(games_data, test_hashes, path):
+            import_games(games_data_to_import, games_data, sha1_to_games, args.dry)
+    finally:
+        # Keep the check sums computed so far even after Ctrl-C
+        if hash_cache:
+            hash_cache.close()
+
+def test_library(games_data, test_hashes, path, hash_cache, jobs):
     tested_games = 0
     passed_tests = 0
     failed_tests = 0
     warnings = 0
 
-    for root, dirs, files in os.walk(path):
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
-        dir_name = os.path.basename(os.path.abspath(root))
+    if test_hashes:
+        game_dirs = scan_library_with_hashes(path, games_data, hash_cache, jobs)
+    else:
+        game_dirs = scan_library_names_only(path, games_data)
 
-        file_names = []
-        hashes = []
-        for file_name in files:
-            _, file_ext = os.path.splitext(file_name)
-            if (file_ext == '.bin' or file_ext == '.cue') and not file_name.startswith('.'):
-                file_names.append(file_name)
-                if test_hashes:
-                    file_path = os.path.abspath(os.path.join(root, file_name))
-                    file_sha1 = compute_sha1_of_file(file_path)
-                    hashes.append(file_sha1)
-            else:
-                print(f"WARNING: garbage file ignored: '{os.path.join(root, file_name)}'")
-                warnings = warnings + 1
+    for (dir_name, file_names, garbage_file_paths, hashes) in game_dirs:
+        for garbage_file_path in garbage_file_paths:
+            print(f"WARNING: garbage file ignored: '{garbage_file_path}'")
+            warnings = warnings + 1
 
         if len(file_names) > 0:
             game_name = dir_name
             ok = True
             if game_name in games_data:
-                expected_file_names = [f.name for f in games_data[game_name].files]
-                expected_file_names.sort()
-                file_names.sort()
+                gd = games_data[game_name]
 
-                if test_hashes:
-                    expected_hashes = [f.sha1 for f in games_data[game_name].files]
-                    expected_hashes.sort()
-                    hashes.sort()
-                    ok = ok and hashes == expected_hashes
+                if hashes != None:
+                    ok = ok and tuple(sorted(hashes)) == gd.sorted_hashes
 
-                ok = ok and file_names == expected_file_names
+                ok = ok and tuple(sorted(file_names)) == gd.sorted_names
 
             else:
                 print(f"Unknown game: '{game_name}'")
@@ -101,13 +116,53 @@ def test_library(games_data, test_hashes, path):
     print(f"  - Failed tests: {failed_tests}")
     print(f"  - warnings: {warnings}")
 
-def import_games(games_data_to_import, games_data, dry):
+def walk_game_dir(root, file_entries, games_data, hash_cache, executor):
+    # Sorts out the files and starts hashing the game ones,
+    # without an executor check sums are not needed
+    abs_root = os.path.abspath(root)
+    dir_name = os.path.basename(abs_root)
+
+    file_names = []
+    game_file_paths = []
+    garbage_file_paths = []
+    for entry in file_entries:
+        if entry.name.endswith(('.bin', '.cue')) and not entry.name.startswith('.'):
+            file_names.append(entry.name)
+            game_file_paths.append(os.path.join(abs_root, entry.name))
+        else:
+            garbage_file_paths.append(entry.path)
+
+    # Reading the files is pointless if the test fails on names already
+    pending_hashes = None
+    if executor and dir_name in games_data and tuple(sorted(file_names)) == games_data[dir_name].sorted_names:
+        pending_hashes = [submit_sha1_of_file(file_path, hash_cache, executor) for file_path in game_file_paths]
+
+    return (dir_name, file_names, garbage_file_paths, pending_hashes)
+
+def scan_library_names_only(path, games_data):
+    # Only directory listings are needed, every directory is reported right away
+    for (root, file_entries) in walk_dirs(path):
+        yield walk_game_dir(root, file_entries, games_data, None, None)
+
+def scan_library_with_hashes(path, games_data, hash_cache, jobs):
+    with sha1_executor(jobs) as executor:
+        # The whole tree is walked first, the workers hash while the results are checked
+        game_dirs = [walk_game_dir(root, file_entries, games_data, hash_cache, executor)
+                     for (root, file_entries) in walk_dirs(path)]
+
+        for (dir_name, file_names, garbage_file_paths, pending_hashes) in game_dirs:
+            hashes = None
+            if pending_hashes != None:
+                hashes = [wait_for_sha1(pending_hash, hash_cache) for pending_hash in pending_hashes]
+            yield (dir_name, file_names, garbage_file_paths, hashes)
+
+def import_games(games_data_to_import, games_data, sha1_to_games, dry):
     for name in games_data_to_import:
         if name in games_data:
             gd_import = games_data_to_import[name]
             gd_db = games_data[name]
 
-            target_game_dir = os.path.abspath(gd_db.name)
+            target_game_dir = gd_db.target_dir
             if os.path.isdir(target_game_dir):
                 print(f"WARNING: game already exists in the library: {name}")
                 continue
@@ -129,31 +184,59 @@ def import_games(games_data_to_import, games_data, dry):
                 print(f"WARNING: validation failed: '{name}'")
         else:
             print(f"WARNING: game not found in the DB: '{name}'")
-            close_matches = difflib.get_close_matches(name, games_data.keys())
+            # Games with the same tracks are the best guess, similar names come next
+            close_matches = find_games_by_content(games_data_to_import[name], sha1_to_games)
+            for possible_name in find_close_matches(name, games_data.keys()):
+                if not possible_name in close_matches:
+                    close_matches.append(possible_name)
             if len(close_matches) > 0:
+                gd_import = games_data_to_import[name]
+                cue_content = read_cue_file(gd_import)
+
                 for possible_name in close_matches:
                     print(f"  - it could be '{possible_name}'. Trying...")
 
-                    renaming_succeeded = try_to_rename_the_game_during_import(games_data[possible_name], games_data_to_import[name], dry)
+                    if os.path.isdir(games_data[possible_name].target_dir):
+                        print(f"WARNING: game already exists in the library: {possible_name}")
+                        continue
+
+                    renaming_succeeded = try_to_rename_the_game_during_import(games_data[possible_name], gd_import, cue_content, dry)
 
                     if renaming_succeeded:
                         print("Done!")
                         break
                 
-def try_to_rename_the_game_during_import(gd_db, gd_import, dry):
+def find_close_matches(name, candidates):
+    if process != None:
+        matches = process.extract(name, candidates, scorer=fuzz.ratio, limit=3, score_cutoff=60)
+        return [match[0] for match in matches]
+    return difflib.get_close_matches(name, candidates)
+
+def get_bin_hashes(gd):
+    return Counter(f.sha1 for f in gd.files if f.ext == '.bin')
+
+def find_games_by_content(gd_import, sha1_to_games):
+    bin_hashes = get_bin_hashes(gd_import)
+    if len(bin_hashes) == 0:
+        return []
+
+    # Common tracks (e.g. silence) belong to many games, start from the rarest one
+    candidates = min((sha1_to_games.get(sha1, []) for sha1 in bin_hashes), key=len)
+    return [gd.name for gd in candidates if get_bin_hashes(gd) == bin_hashes]
+
+def try_to_rename_the_game_during_import(gd_db, gd_import, cue_content, dry):
     target_bins_hashes = {}
     target_cue_sha1 = None
     target_cue_fpath = None
     bins_to_import_hashes = dict([(f.sha1, os.path.join(gd_import.description, f.name))
                                   for f in gd_import.files
-                                  if os.path.splitext(f.name)[1] == '.bin'])
+                                  if f.ext == '.bin'])
     bin_files_renamings = {}
-    target_game_dir = os.path.abspath(gd_db.name)
+    target_game_dir = gd_db.target_dir
 
     for f in gd_db.files:
         to_path = os.path.join(target_game_dir, f.name)
-        _, ext = os.path.splitext(f.name)
-        if ext == '.cue':
+        if f.ext == '.cue':
             if target_cue_sha1 != None:
                 print(f"ERROR: '.cue' file is not unique for game '{gd_db.name}'")
                 return False
@@ -169,19 +252,17 @@ def try_to_rename_the_game_during_import(gd_db, gd_import, dry):
 
             bin_files_renamings[os.path.basename(from_path)] = f.name
 
-        if target_cue_sha1 == None:
-            print(f"ERROR: '.cue' file not found for game '{gd_db.name}'")
-            return False
+    if target_cue_sha1 == None:
+        print(f"ERROR: '.cue' file not found for game '{gd_db.name}'")
+        return False
 
     orig_cue_fpath = get_cue_file_path(gd_import)
-    if orig_cue_fpath == None:
+    if cue_content == None:
         print(f"ERROR: '.cue' file not found for the game being imported - '{gd_import.name}'")
         return False
 
-    with open(orig_cue_fpath, 'rb') as file:
-        cue_content = file.read()
-    modified_cue_content = replace_substrings(cue_content, bin_files_renamings)
-    modified_cue_sha1 = calculate_sha1(modified_cue_content)
+    (modified_cue_content, modified_cue_sha1) = rename_and_hash_cue(cue_content,
+                                                                    tuple(sorted(bin_files_renamings.items())))
 
     if modified_cue_sha1 != target_cue_sha1:
         print("Failed to modify '.cue' file")
@@ -216,25 +297,40 @@ def try_to_rename_the_game_during_import(gd_db, gd_import, dry):
 
     return True
 
+# Several candidate games often need the very same '.cue' renamings
+@functools.lru_cache(maxsize=64)
+def rename_and_hash_cue(cue_content, renamings):
+    modified_cue_content = replace_substrings(cue_content, dict(renamings))
+    return (modified_cue_content, calculate_sha1(modified_cue_content))
+
 def calculate_sha1(data):
     sha1 = hashlib.sha1()
     sha1.update(data)
     return sha1.hexdigest()
 
 def replace_substrings(content, replacements):
-    for old, new in replacements.items():
-        content = content.replace(old.encode('utf-8'), new.encode('utf-8'))
-    return content
+    if len(replacements) == 0:
+        return content
+
+    replacements_b = {old.encode('utf-8'): new.encode('utf-8') for old, new in replacements.items()}
+    # Longer names first, so a name is never replaced by a prefix of it
+    pattern = re.compile(b'|'.join(map(re.escape, sorted(replacements_b, key=len, reverse=True))))
+    return pattern.sub(lambda m: replacements_b[m.group(0)], content)
 
 def get_cue_file_path(gd_import):
-    for f in gd_import.files:
-        _, ext = os.path.splitext(f.name)
-        if ext == '.cue':
-            return os.path.join(gd_import.description, f.name)
-    return None
+    if gd_import.cue == None:
+        return None
+    return os.path.join(gd_import.description, gd_import.cue.name)
+
+def read_cue_file(gd_import):
+    cue_fpath = get_cue_file_path(gd_import)
+    if cue_fpath == None:
+        return None
+    with open(cue_fpath, 'rb') as file:
+        return file.read()
 
 def get_import_file_path(gd_import, sha1, name):
-    candidates = [f for f in gd_import.files if f.sha1 == sha1]
+    candidates = gd_import.by_sha1.get(sha1, [])
 
     if len(candidates) > 1:
         names = [f.name for f in candidates]
@@ -247,7 +343,8 @@ def get_import_file_path(gd_import, sha1, name):
     return None
 
 def find_db_export_archive(directory):
-    db_archives = list(filter(lambda p : p.endswith(".zip"), os.listdir(directory)))
+    with os.scandir(directory) as it:
+        db_archives = [entry.name for entry in it if entry.name.endswith(".zip")]
 
     if len(db_archives) == 0:
         raise FileNotFoundError("DB arhive not found.")
@@ -261,17 +358,17 @@ def find_db_export_archive(directory):
 
     return os.path.join(directory, db_archives[0])
 
-def extract_dat_from_archive(archive_path):
+@contextmanager
+def extract_dat_stream(archive_path):
     with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-        xml_files = [name for name in zip_ref.namelist() if name.endswith('.dat')]
+        xml_files = [zip_info for zip_info in zip_ref.infolist() if zip_info.filename.endswith('.dat')]
         if len(xml_files) != 1:
             raise FileNotFoundError("The archive does not contain exactly one XML file.")
+        # Opening by ZipInfo skips the name lookup
         with zip_ref.open(xml_files[0]) as xml_file:
-            return xml_file.read()
+            yield xml_file
 
-def print_header(root):
-    header = root.find('header')
-    
+def print_header(header):
     if header is not None:
         name = header.find('name')
         description = header.find('description')
@@ -286,66 +383,241 @@ def print_header(root):
         print("Warning: header not found")
 
 class FileInfo:
+    __slots__ = ('name', 'sha1', 'ext')
+
     def __init__(self, name, sha1):
         self.name = name
         self.sha1 = sha1
+        self.ext = os.path.splitext(name)[1]
 
 class GameInfo:
+    __slots__ = ('name', 'category', 'description', 'files', 'by_sha1', 'cue', 'sorted_names', 'sorted_hashes',
+                 '_target_dir')
+
     def __init__(self, name, category, description, files):
         self.name = name
         self.category = category
         self.description = description
         self.files = files
 
-def load_games_data_from_db(root, args):
+        # Several files may have the same check sum (e.g. silent audio tracks)
+        self.by_sha1 = {}
+        for f in files:
+            self.by_sha1.setdefault(f.sha1, []).append(f)
+        self.cue = next((f for f in files if f.ext == '.cue'), None)
+
+        # What a game directory is compared with by test_library()
+        self.sorted_names = tuple(sorted(f.name for f in files))
+        self.sorted_hashes = tuple(sorted(f.sha1 for f in files))
+
+        self._target_dir = None
+
+    # Where the game goes in the library, only needed for imported games
+    @property
+    def target_dir(self):
+        if self._target_dir == None:
+            self._target_dir = os.path.abspath(self.name)
+        return self._target_dir
+
+def load_games_data_from_db(archive_path, args):
     games_data = {}
-    for game in root.findall('game'):
-        game_name = game.attrib.get('name')
+    sha1_to_games = {}
+    header = None
+
+    with extract_dat_stream(archive_path) as xml_file:
+        # Stream the DAT file, only one game is kept in memory at a time
+        root = None
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event != 'end':
+                continue
 
-        category = game.find('category').text
-        description = game.find('description').text
+            if elem.tag == 'header':
+                header = elem
+            elif elem.tag == 'game':
+                g = load_game_info(elem)
+                games_data[g.name] = g
+                for sha1 in g.by_sha1:
+                    sha1_to_games.setdefault(sha1, []).append(g)
+                elem.clear()
+                root.remove(elem)
 
-        fs = []
-        for rom_file in game.findall('rom'):
-            rom_file_name = rom_file.get('name')
-            rom_file_sha1 = rom_file.get('sha1')
+    return (games_data, sha1_to_games, header)
 
-            f = FileInfo(rom_file_name, rom_file_sha1)
-            fs.append(f)
+def load_game_info(game):
+    game_name = game.attrib.get('name')
 
-        g = GameInfo(game_name, category, description, fs)
-        games_data[game_name] = g
+    category = game.find('category').text
+    description = game.find('description').text
 
-    return games_data
+    fs = []
+    for rom_file in game.findall('rom'):
+        rom_file_name = rom_file.get('name')
+        rom_file_sha1 = rom_file.get('sha1')
+
+        f = FileInfo(rom_file_name, rom_file_sha1)
+        fs.append(f)
+
+    return GameInfo(game_name, category, description, fs)
+
+# hashlib.sha1 is backed by OpenSSL when available, which uses SHA-NI or
+# ARMv8 SHA instructions if the CPU has them
+SHA1_PROTOTYPE = hashlib.new('sha1')
+
+def get_sha1_backend_name():
+    if type(SHA1_PROTOTYPE).__module__ == '_hashlib':
+        return ssl.OPENSSL_VERSION
+    return 'builtin'
+
+MMAP_HASHING_THRESHOLD = 16 * 1024 * 1024
 
 def compute_sha1_of_file(file_path):
-    sha1 = hashlib.sha1()
-    with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
-            sha1.update(chunk)
+    # Unbuffered, the digest loop reads in large blocks on its own
+    with open(file_path, 'rb', buffering=0) as f:
+        # Images are read once from start to end, ask for more readahead
+        # and don't let them push everything else out of the page cache
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        if os.fstat(f.fileno()).st_size > MMAP_HASHING_THRESHOLD:
+            # Large tracks are hashed in place, without copying them into Python buffers
+            sha1 = SHA1_PROTOTYPE.copy()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                sha1.update(mm)
+        elif sys.version_info >= (3, 11):
+            sha1 = hashlib.file_digest(f, SHA1_PROTOTYPE.copy)
+        else:
+            sha1 = SHA1_PROTOTYPE.copy()
+            while chunk := f.read(1024 * 1024):
+                sha1.update(chunk)
+
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
     return sha1.hexdigest()
 
-def load_games_data_to_import(import_path):
+class HashCache:
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS hashes('
+                        'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, sha1 TEXT)')
+        self.pending_stores = 0
+
+    def lookup(self, file_path, file_stat):
+        row = self.db.execute('SELECT sha1 FROM hashes WHERE path=? AND size=? AND mtime=?',
+                              (file_path, file_stat.st_size, file_stat.st_mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def store(self, file_path, file_stat, sha1):
+        # Entries of changed files are replaced
+        self.db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                        (file_path, file_stat.st_size, file_stat.st_mtime_ns, sha1))
+
+        # Don't lose hours of hashing if the run is interrupted
+        self.pending_stores += 1
+        if self.pending_stores >= 100:
+            self.db.commit()
+            self.pending_stores = 0
+
+    def remove_missing_files(self):
+        # Imported files are moved away, drop their entries
+        missing_paths = [(path,) for (path,) in self.db.execute('SELECT path FROM hashes')
+                         if not os.path.exists(path)]
+        self.db.executemany('DELETE FROM hashes WHERE path=?', missing_paths)
+
+    def close(self):
+        self.remove_missing_files()
+        self.db.commit()
+        self.db.close()
+
+# The cache is only used from the main thread, workers just hash the files
+def submit_sha1_of_file(file_path, hash_cache, executor):
+    file_stat = None
+    if hash_cache:
+        file_stat = os.stat(file_path)
+        sha1 = hash_cache.lookup(file_path, file_stat)
+        if sha1 != None:
+            return (file_path, file_stat, sha1, None)
+    return (file_path, file_stat, None, executor.submit(compute_sha1_of_file, file_path))
+
+def wait_for_sha1(pending_hash, hash_cache):
+    (file_path, file_stat, sha1, future) = pending_hash
+    if future != None:
+        sha1 = future.result()
+        if hash_cache:
+            hash_cache.store(file_path, file_stat, sha1)
+    return sha1
+
+@contextmanager
+def sha1_executor(jobs):
+    # hashlib releases the GIL while hashing, so threads are enough
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        yield executor
+    finally:
+        # Everything is consumed on success, on Ctrl-C or an error
+        # only the files being hashed right now are waited for
+        executor.shutdown(cancel_futures=True)
+
+def compute_sha1_of_files(file_paths, hash_cache, jobs):
+    with sha1_executor(jobs) as executor:
+        pending_hashes = [submit_sha1_of_file(file_path, hash_cache, executor) for file_path in file_paths]
+
+        # Yield in the original order as soon as the check sums are ready
+        for pending_hash in pending_hashes:
+            yield wait_for_sha1(pending_hash, hash_cache)
+
+def walk_dirs(path):
+    # Same order as os.walk(), but hidden directories are skipped right away
+    # and files are returned as DirEntry objects
+    dir_paths = [path]
+    while dir_paths:
+        dir_path = dir_paths.pop()
+
+        sub_dir_paths = []
+        file_entries = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if not entry.name.startswith('.') and not entry.is_symlink():
+                        sub_dir_paths.append(entry.path)
+                else:
+                    file_entries.append(entry)
+
+        yield (dir_path, file_entries)
+
+        dir_paths.extend(reversed(sub_dir_paths))
+
+def load_games_data_to_import(import_path, hash_cache, jobs):
     games_data = {}
 
-    for root, dirs, files in os.walk(import_path):
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
-        dir_name = os.path.basename(os.path.abspath(root))
-
-        fs = []
-        for file_name in files:
-            _, file_ext = os.path.splitext(file_name)
-            if (file_ext == '.bin' or file_ext == '.cue') and not file_name.startswith('.'):
-                file_path = os.path.abspath(os.path.join(root, file_name))
-                file_sha1 = compute_sha1_of_file(file_path)
-                f = FileInfo(file_name, file_sha1)
-                fs.append(f)
+    # Collect all the files first, so they can be hashed in parallel
+    game_dirs = []
+    for (root, file_entries) in walk_dirs(os.path.abspath(import_path)):
+        dir_name = os.path.basename(root)
+
+        file_names = []
+        for entry in file_entries:
+            if entry.name.endswith(('.bin', '.cue')) and not entry.name.startswith('.'):
+                file_names.append(entry.name)
             else:
-                print(f"WARNING: ignored unknown file type: {file_name}")
+                print(f"WARNING: ignored unknown file type: {entry.name}")
 
-        if len(fs) > 0:
-            game_name = dir_name
-            games_data[dir_name] = GameInfo(dir_name, 'IMPORT', os.path.abspath(root), fs)
+        if len(file_names) > 0:
+            game_dirs.append((root, dir_name, file_names))
+
+    all_hashes = compute_sha1_of_files([os.path.join(root, file_name)
+                                        for (root, _, file_names) in game_dirs
+                                        for file_name in file_names],
+                                       hash_cache, jobs)
+
+    for (root, dir_name, file_names) in game_dirs:
+        fs = [FileInfo(file_name, next(all_hashes)) for file_name in file_names]
+        games_data[dir_name] = GameInfo(dir_name, 'IMPORT', root, fs)
 
     return games_data
 